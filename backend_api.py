@@ -3,15 +3,34 @@ Material Identification Backend API (Clean Version)
 Lightweight REST API for material detection using TensorFlow Lite
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request
 from flask_cors import CORS
 import numpy as np
+import orjson
+import cv2
 import tensorflow as tf
-from PIL import Image
+import PIL
+from PIL import Image, features
 import io
-import base64
+import pybase64
 import os
+import queue
+import threading
+import atexit
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime
+from inference_common import (
+    quantize_input, dequantize_output, next_batch, fail_batch, get_resize_buffer
+)
+
+# Optional: Numba fuses the uint8 -> float32 normalization into one pass
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 app = Flask(__name__)
 CORS(app)
@@ -21,6 +40,19 @@ MODEL_PATH = "model/model.tflite"
 LABELS_PATH = "model/labels.txt"
 SAVE_IMAGES = False  # Disabled to prevent storage issues on VPS
 IMAGES_SAVE_DIR = "saved_images"
+# Both can be overridden from the environment; gunicorn_conf.py divides the cores between workers
+NUM_THREADS = int(os.environ.get("NUM_THREADS", 0)) or os.cpu_count() or 1  # TFLite threads for this process (split across the pool)
+INTERPRETER_POOL_SIZE = int(os.environ.get("INTERPRETER_POOL_SIZE", 2))  # Interpreters (each with its own inference worker thread)
+THREADS_PER_INTERPRETER = max(1, NUM_THREADS // INTERPRETER_POOL_SIZE)
+MAX_BATCH_SIZE = 8  # Max concurrent requests combined into one invoke()
+PREDICTION_CACHE_SIZE = 0  # >0 reuses predictions of recent near-identical frames (perceptual hash); e.g. 256
+DECODE_PROCESSES = 0  # >0 decodes images in a process pool; try os.cpu_count() - 1 on multi-core hosts
+
+# Sorting action per material; anything else is rejected
+ACTION_MAP = {
+    "Plastic Bottle": "sort_plastic",
+    "Tin Can": "sort_tin_can"
+}
 
 # Create save directory if enabled
 if SAVE_IMAGES and not os.path.exists(IMAGES_SAVE_DIR):
@@ -31,30 +63,254 @@ if SAVE_IMAGES and not os.path.exists(IMAGES_SAVE_DIR):
 with open(LABELS_PATH, 'r') as f:
     labels = [line.strip().split(' ', 1)[1] for line in f if line.strip()]
     labels = [label for label in labels if label]
+num_labels = len(labels)
 
-print(f"Loaded {len(labels)} labels: {labels}")
+print(f"Loaded {num_labels} labels: {labels}")
+print(f"Pillow version: {PIL.__version__}")
+print(f"libjpeg-turbo: {'available' if features.check_feature('libjpeg_turbo') else 'NOT available'}")
+print(f"Numba normalization: {'ENABLED' if njit is not None else 'DISABLED (numpy fallback)'}")
 
-# Load TensorFlow Lite model
-try:
-    interpreter = tf.lite.Interpreter(model_path=MODEL_PATH)
+
+def create_interpreter():
+    """Create a TFLite interpreter with its own allocated tensors"""
+    interpreter = tf.lite.Interpreter(
+        model_path=MODEL_PATH,
+        num_threads=THREADS_PER_INTERPRETER
+    )
     interpreter.allocate_tensors()
-    input_details = interpreter.get_input_details()
-    output_details = interpreter.get_output_details()
-    print(f"Model loaded: {MODEL_PATH}")
-    print(f"Input shape: {input_details[0]['shape']}")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    interpreter = None
-    input_details = None
-    output_details = None
+    return interpreter
+
+
+if njit is not None:
+    @njit(fastmath=True, cache=True)
+    def normalize_pixels(src, dst):
+        """Scale 0-255 uint8 pixels to 0-1 float32, written straight into dst"""
+        scale = np.float32(1.0 / 255.0)
+        for i in range(src.shape[0]):
+            for j in range(src.shape[1]):
+                for c in range(src.shape[2]):
+                    dst[i, j, c] = src[i, j, c] * scale
+else:
+    def normalize_pixels(src, dst):
+        """Scale 0-255 uint8 pixels to 0-1 float32, written straight into dst"""
+        np.divide(src, np.float32(255.0), out=dst)
+
+
+def decode_image(image_data, keep_full_size=False, out=None):
+    """Decode image bytes to a 224x224 RGB uint8 array, plus the decoded PIL image"""
+    image = Image.open(io.BytesIO(image_data))
+    
+    # Let libjpeg downscale during IDCT (1/2, 1/4, 1/8) and emit RGB directly,
+    # unless the full-resolution image is needed (e.g. for saving)
+    if not keep_full_size:
+        image.draft('RGB', (224, 224))
+    
+    # Saved images are written as JPEG, which needs RGB
+    if keep_full_size and image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    # Get 3 RGB channels with numpy views instead of PIL's scalar convert()
+    pixels = np.asarray(image)
+    if image.mode == 'RGBA':
+        pixels = pixels[..., :3]
+    elif image.mode == 'L':
+        pixels = np.broadcast_to(pixels[..., np.newaxis], pixels.shape + (3,))
+    elif image.mode != 'RGB':
+        # Palette, CMYK, 16-bit etc. still need PIL
+        pixels = np.asarray(image.convert('RGB'))
+    
+    # Resize for model (224x224 for Teachable Machine) on the numpy buffer
+    image_resized = cv2.resize(pixels, (224, 224), dst=out, interpolation=cv2.INTER_AREA)
+    return image_resized, image
+
+
+def init_decode_worker(slot_names):
+    """Process-pool initializer: attach to the shared-memory decode slots once"""
+    global decode_slot_arrays
+    
+    decode_slot_arrays = []
+    for name in slot_names:
+        # The parent unlinks these segments. Spawned children share the parent's
+        # resource tracker, so attaching here only re-registers the same names
+        shm = shared_memory.SharedMemory(name=name)
+        # Keep the SharedMemory alive: collecting it closes the mmap under the array view
+        decode_segments.append(shm)
+        decode_slot_arrays.append(np.ndarray((224, 224, 3), dtype=np.uint8, buffer=shm.buf))
+
+
+def decode_into_slot(image_data, slot):
+    """Process-pool task: decode and resize straight into a shared-memory slot"""
+    decode_image(image_data, out=decode_slot_arrays[slot])
+
+
+def start_decode_pool():
+    """Start the decode process pool and the shared-memory slots it writes into"""
+    global decode_executor, decode_slot_arrays
+    
+    # Enough slots for every request that is decoding or waiting on inference
+    num_slots = DECODE_PROCESSES + INTERPRETER_POOL_SIZE * MAX_BATCH_SIZE
+    segments = [shared_memory.SharedMemory(create=True, size=224 * 224 * 3) for _ in range(num_slots)]
+    decode_slot_arrays = [np.ndarray((224, 224, 3), dtype=np.uint8, buffer=shm.buf) for shm in segments]
+    for slot in range(num_slots):
+        decode_slots.put(slot)
+    
+    # spawn: forking a process that already runs TFLite/OpenCV threads is unsafe
+    decode_executor = ProcessPoolExecutor(
+        max_workers=DECODE_PROCESSES,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_decode_worker,
+        initargs=([shm.name for shm in segments],)
+    )
+    
+    def cleanup():
+        decode_executor.shutdown(wait=False, cancel_futures=True)
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+    atexit.register(cleanup)
+    print(f"Decode pool: {DECODE_PROCESSES} processes, {num_slots} shared-memory slots")
+
+
+def run_inference(image_resized):
+    """Queue a 224x224 uint8 image for the inference workers and wait for its predictions"""
+    future = Future()
+    inference_queue.put((image_resized, future))
+    return future.result()
+
+
+def image_hash(image_resized):
+    """Cache key for a 224x224 RGB image: 64-bit grayscale dHash plus coarse colour"""
+    gray = cv2.cvtColor(image_resized, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    # dHash ignores hue, so equal-luma objects of different colours would
+    # collide; add 4x4 per-channel means quantized to 16 levels
+    colour = cv2.resize(image_resized, (4, 4), interpolation=cv2.INTER_AREA) >> 4
+    return np.packbits(bits).tobytes() + colour.tobytes()
+
+
+def cached_inference(image_resized):
+    """Run inference, reusing the predictions of a recent frame with the same perceptual hash"""
+    if PREDICTION_CACHE_SIZE <= 0:
+        return run_inference(image_resized)
+    
+    key = image_hash(image_resized)
+    with prediction_cache_lock:
+        predictions = prediction_cache.get(key)
+        if predictions is not None:
+            prediction_cache.move_to_end(key)
+            return predictions
+    
+    predictions = run_inference(image_resized)
+    
+    with prediction_cache_lock:
+        prediction_cache[key] = predictions
+        if len(prediction_cache) > PREDICTION_CACHE_SIZE:
+            prediction_cache.popitem(last=False)
+    return predictions
+
+
+def inference_worker(interpreter):
+    """Run queued 224x224 uint8 images through the interpreter in micro-batches"""
+    input_index = input_details[0]['index']
+    # Zero-copy accessors for the interpreter-owned buffers; views they return
+    # must not be held across invoke() or allocate_tensors()
+    input_tensor = interpreter.tensor(input_index)
+    output_tensor = interpreter.tensor(output_details[0]['index'])
+    # Batching needs a dynamic batch dimension in the model
+    max_batch_size = MAX_BATCH_SIZE if input_details[0]['shape_signature'][0] == -1 else 1
+    batch_size = 1
+    
+    while True:
+        batch = next_batch(inference_queue, max_batch_size)
+        try:
+            if len(batch) != batch_size:
+                interpreter.resize_tensor_input(input_index, [len(batch), 224, 224, 3])
+                interpreter.allocate_tensors()
+                batch_size = len(batch)
+            
+            # Normalize straight into the interpreter's input tensor (no set_tensor copy)
+            for i, (pixels, _) in enumerate(batch):
+                if input_details[0]['dtype'] == np.float32:
+                    normalize_pixels(pixels, input_tensor()[i])
+                else:
+                    # INT8 models (see convert_model.py) take quantized input
+                    input_tensor()[i] = quantize_input(pixels, input_details[0])
+            
+            interpreter.invoke()
+            predictions = output_tensor().copy()
+            if output_details[0]['dtype'] != np.float32:
+                predictions = dequantize_output(predictions, output_details[0])
+            
+            for i, (_, future) in enumerate(batch):
+                future.set_result(predictions[i:i + 1])
+        except Exception as e:
+            fail_batch(batch, e)
+
+
+def load_model():
+    """Load the TFLite interpreters and start their inference workers"""
+    global model_loaded, input_details, output_details
+    
+    try:
+        # Compile the normalization kernel now rather than on the first request
+        normalize_pixels(np.zeros((224, 224, 3), np.uint8), np.empty((224, 224, 3), np.float32))
+        
+        interpreters = [create_interpreter() for _ in range(INTERPRETER_POOL_SIZE)]
+        input_details = interpreters[0].get_input_details()
+        output_details = interpreters[0].get_output_details()
+        for interpreter in interpreters:
+            threading.Thread(target=inference_worker, args=(interpreter,), daemon=True).start()
+        if DECODE_PROCESSES > 0:
+            start_decode_pool()
+        model_loaded = True
+        print(f"Model loaded: {MODEL_PATH} ({INTERPRETER_POOL_SIZE} interpreters, {THREADS_PER_INTERPRETER} threads each)")
+        print(f"Input shape: {input_details[0]['shape_signature']}")
+        print(f"Input dtype: {input_details[0]['dtype'].__name__}")
+    except Exception as e:
+        print(f"Error loading model: {e}")
+        model_loaded = False
+        input_details = None
+        output_details = None
+
+
+# Interpreters are not thread-safe, so each one is owned by a single inference worker
+inference_queue = queue.Queue()
+model_loaded = False
+input_details = None
+output_details = None
+
+# LRU of image_hash -> predictions; a camera watching an idle belt sends near-identical frames
+prediction_cache = OrderedDict()
+prediction_cache_lock = threading.Lock()
+
+# Optional decode process pool (see DECODE_PROCESSES)
+decode_executor = None
+decode_slots = queue.Queue()
+decode_slot_arrays = []
+decode_segments = []  # SharedMemory handles backing decode_slot_arrays in pool processes
+
+# Load TensorFlow Lite model
+# Under gunicorn --preload (gunicorn_conf.py) this is deferred to each worker's
+# post_fork hook, since interpreter threads do not survive fork().
+# Decode pool processes re-import this module and never load the model. They
+# import it while unpickling their initializer, before parent_process() is
+# set, so check the process name (set earlier by spawn) instead.
+if not os.environ.get("DEFER_MODEL_LOAD") and multiprocessing.current_process().name == 'MainProcess':
+    load_model()
+
+
+def ojsonify(obj, status=200):
+    """JSON response serialized with orjson (faster than Flask's jsonify)"""
+    return app.response_class(orjson.dumps(obj), status=status, mimetype="application/json")
 
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({
+    return ojsonify({
         "status": "healthy",
-        "model_loaded": interpreter is not None,
+        "model_loaded": model_loaded,
         "labels": labels
     })
 
@@ -62,9 +318,9 @@ def health():
 @app.route('/identify/test', methods=['GET'])
 def test():
     """Test endpoint"""
-    return jsonify({
+    return ojsonify({
         "message": "Backend API is running",
-        "model_loaded": interpreter is not None,
+        "model_loaded": model_loaded,
         "labels_available": labels
     })
 
@@ -73,13 +329,13 @@ def test():
 def identify_material():
     """
     Identify material from image using TensorFlow Lite model
-    Accepts: Binary JPEG data or Base64 encoded JSON
+    Accepts: Binary JPEG data (preferred) or Base64 encoded JSON
     """
-    if interpreter is None:
-        return jsonify({
+    if not model_loaded:
+        return ojsonify({
             "success": False,
             "error": "Model not loaded"
-        }), 500
+        }, 500)
     
     try:
         # Get image data
@@ -90,93 +346,77 @@ def identify_material():
         elif 'application/json' in content_type:
             json_data = request.get_json()
             if 'image' in json_data:
-                image_data = base64.b64decode(json_data['image'])
+                image_data = pybase64.b64decode(json_data['image'], validate=False)
             else:
-                return jsonify({
+                return ojsonify({
                     "success": False,
                     "error": "No image data in JSON"
-                }), 400
+                }, 400)
         else:
             image_data = request.data
         
         if not image_data:
-            return jsonify({
+            return ojsonify({
                 "success": False,
                 "error": "No image data received"
-            }), 400
+            }, 400)
         
-        # Open and process image
-        image = Image.open(io.BytesIO(image_data))
-        
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Save raw image if enabled
-        if SAVE_IMAGES:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-            temp_filename = f"{IMAGES_SAVE_DIR}/temp_{timestamp}.jpg"
-            image.save(temp_filename, 'JPEG', quality=95)
-        
-        # Resize for model (224x224 for Teachable Machine)
-        image_resized = image.resize((224, 224))
-        
-        # Convert to numpy array and normalize
-        image_array = np.asarray(image_resized, dtype=np.float32) / 255.0
-        image_array = np.expand_dims(image_array, axis=0)
-        
-        # Run inference
-        interpreter.set_tensor(input_details[0]['index'], image_array)
-        interpreter.invoke()
-        predictions = interpreter.get_tensor(output_details[0]['index'])
+        # Saving needs the full-size image in this process, so it always decodes inline
+        if decode_executor is not None and not SAVE_IMAGES:
+            # Decode in the process pool into a shared-memory slot (no pickled pixels)
+            slot = decode_slots.get()
+            try:
+                decode_executor.submit(decode_into_slot, image_data, slot).result()
+                predictions = cached_inference(decode_slot_arrays[slot])
+            finally:
+                decode_slots.put(slot)
+        else:
+            image_resized, image = decode_image(image_data, keep_full_size=SAVE_IMAGES, out=get_resize_buffer())
+            
+            # Run inference (batched with other concurrent requests)
+            predictions = cached_inference(image_resized)
         
         # Get results
-        confidence = float(np.max(predictions[0]))
-        predicted_class_index = int(np.argmax(predictions[0]))
+        predicted_class_index = int(predictions[0].argmax())
+        confidence = float(predictions[0][predicted_class_index])
         
-        if predicted_class_index < len(labels):
+        if predicted_class_index < num_labels:
             material_type = labels[predicted_class_index]
         else:
             material_type = "Unknown"
         
         # Determine action
-        if material_type == "Plastic Bottle":
-            action = "sort_plastic"
-        elif material_type == "Tin Can":
-            action = "sort_tin_can"
-        else:
-            action = "reject"
+        action = ACTION_MAP.get(material_type, "reject")
         
-        # Rename saved image with results
+        # Save image once, named with the results (no temp file + rename)
         if SAVE_IMAGES:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
             confidence_percent = int(confidence * 100)
             final_filename = f"{IMAGES_SAVE_DIR}/{timestamp}_{material_type.replace(' ', '_')}_{confidence_percent}pct.jpg"
             try:
-                os.rename(temp_filename, final_filename)
+                image.save(final_filename, 'JPEG', quality=85, optimize=False)
                 print(f"Saved: {final_filename}")
             except Exception as e:
                 print(f"Error saving image: {e}")
         
         print(f"Detection: {material_type} ({confidence:.2%})")
         
-        return jsonify({
+        return ojsonify({
             "success": True,
             "materialType": material_type,
             "confidence": round(confidence, 2),
             "action": action,
-            "allPredictions": {
-                labels[i]: float(predictions[0][i]) 
-                for i in range(len(labels))
-            }
+            "allPredictions": dict(zip(labels, predictions[0].tolist()))
         })
         
     except Exception as e:
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return ojsonify({
             "success": False,
             "error": str(e)
-        }), 500
+        }, 500)
 
 
 if __name__ == '__main__':
@@ -199,7 +439,8 @@ if __name__ == '__main__':
     print("Press Ctrl+C to stop")
     print("="*60 + "\n")
     
-    # Production deployment: use gunicorn
-    # gunicorn -w 2 -b 0.0.0.0:5001 --timeout 120 backend_api:app
+    # Development server (Flask's threaded server).
+    # Production deployment: use gunicorn with gthread workers
+    # gunicorn -c gunicorn_conf.py wsgi:app
     
-    app.run(host='0.0.0.0', port=5001, debug=False, use_reloader=False, threaded=True)
+    app.run(host='0.0.0.0', port=5001, debug=False, use_reloader=False)
@@ -4,28 +4,40 @@ Uses Teachable Machine TensorFlow Lite model for classification
 With OpenCV real-time monitoring from ESP32-CAM stream
 """
 
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, Response
 from flask_cors import CORS
 import numpy as np
+import orjson
 import tensorflow as tf
-from PIL import Image
-import io
 import base64
 import cv2
 import threading
+import functools
+import queue
 import urllib.request
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import time
 import os
+from concurrent.futures import Future
 from datetime import datetime
+from inference_common import (
+    quantize_input, dequantize_output, next_batch, fail_batch, get_resize_buffer
+)
+
+# Optional: Numba fuses the stream preprocessing into a single pass
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for ESP8266/ESP32-CAM requests
 
 # Load the Teachable Machine TensorFlow Lite model
 MODEL_PATH = "model/model.tflite"
+INT8_MODEL_PATH = "model/model_int8.tflite"  # Preferred if present (see convert_model.py)
 LABELS_PATH = "model/labels.txt"
 
 # Image saving configuration
@@ -37,6 +49,26 @@ if SAVE_IMAGES and not os.path.exists(IMAGES_SAVE_DIR):
     os.makedirs(IMAGES_SAVE_DIR)
     print(f"Created directory for saving images: {IMAGES_SAVE_DIR}")
 
+# Saved images are written by a background thread so disk I/O never blocks a response
+save_queue = queue.Queue(maxsize=64)
+
+def save_worker():
+    """Write queued (image bytes, path) pairs to disk"""
+    while True:
+        image_data, path = save_queue.get()
+        try:
+            with open(path, 'wb') as f:
+                f.write(image_data)
+            print(f"Saved image: {path}")
+        except Exception as e:
+            print(f"Error saving image: {e}")
+
+if SAVE_IMAGES:
+    threading.Thread(target=save_worker, daemon=True).start()
+
+# Inference batching: concurrent requests are combined into one invoke()
+MAX_BATCH_SIZE = 8
+
 # ESP32-CAM Streaming URL (update with your ESP32-CAM IP)
 ESP32_CAM_STREAM_URL = "http://192.168.31.76:81/stream"  # Port 81 for ESP32-CAM stream
 
@@ -48,6 +80,11 @@ latest_prediction = {
     "frame_count": 0
 }
 prediction_lock = threading.Lock()
+# Latest overlaid frame as JPEG bytes for web streaming, kept apart from the
+# small JSON-serializable prediction dict so neither lock guards the other
+latest_frame_jpeg = None
+frame_lock = threading.Lock()
+frame_event = threading.Condition(frame_lock)  # Notified when a new frame JPEG is stored
 monitoring_active = False
 
 # Load labels
@@ -56,11 +93,19 @@ with open(LABELS_PATH, 'r') as f:
     # Remove empty lines
     labels = [label for label in labels if label]
 
+# Immutable copy for the hot path (labels are fixed once loaded)
+LABELS = tuple(labels)
+
 print(f"Loaded {len(labels)} labels: {labels}")
 
 # Load TensorFlow Lite model
+# TFLite runs float and INT8 models through the XNNPACK delegate by default;
+# a full-integer model roughly doubles CPU throughput
 try:
-    interpreter = tf.lite.Interpreter(model_path=MODEL_PATH)
+    if os.path.exists(INT8_MODEL_PATH):
+        MODEL_PATH = INT8_MODEL_PATH
+    # Leave half the cores for request handling, decoding and the stream loop
+    interpreter = tf.lite.Interpreter(model_path=MODEL_PATH, num_threads=max(1, (os.cpu_count() or 1) // 2))
     interpreter.allocate_tensors()
     
     # Get input and output tensors
@@ -73,6 +118,10 @@ try:
     print(f"Input dtype: {input_details[0]['dtype']}")
     print(f"Output dtype: {output_details[0]['dtype']}")
     
+    # Every output index maps to a label, so the hot path indexes LABELS unchecked
+    assert output_details[0]['shape'][-1] == len(LABELS), \
+        f"Model has {output_details[0]['shape'][-1]} outputs but {LABELS_PATH} has {len(LABELS)} labels"
+    
 except Exception as e:
     print(f"Error loading TensorFlow Lite model: {e}")
     import traceback
@@ -81,6 +130,88 @@ except Exception as e:
     input_details = None
     output_details = None
 
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def preprocess_frame(frame_bgr, out):
+        """Nearest-neighbour resize, BGR->RGB and /255 in one pass into out (224, 224, 3)"""
+        src_h, src_w = frame_bgr.shape[0], frame_bgr.shape[1]
+        dst_h, dst_w = out.shape[0], out.shape[1]
+        scale = np.float32(1.0 / 255.0)
+        for y in prange(dst_h):
+            sy = (y * src_h) // dst_h
+            for x in range(dst_w):
+                sx = (x * src_w) // dst_w
+                out[y, x, 0] = frame_bgr[sy, sx, 2] * scale
+                out[y, x, 1] = frame_bgr[sy, sx, 1] * scale
+                out[y, x, 2] = frame_bgr[sy, sx, 0] * scale
+else:
+    def preprocess_frame(frame_bgr, out):
+        """Nearest-neighbour resize, BGR->RGB and /255 into out (224, 224, 3)"""
+        resized = cv2.resize(frame_bgr, (out.shape[1], out.shape[0]), interpolation=cv2.INTER_NEAREST)
+        rgb_frame = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+        np.divide(rgb_frame, np.float32(255.0), out=out)
+
+def inference_worker():
+    """Sole owner of the interpreter: run queued requests in micro-batches"""
+    input_index = input_details[0]['index']
+    # Zero-copy accessor for the interpreter-owned input buffer: requests write
+    # straight into it instead of set_tensor() copying ~600 KB per inference.
+    # The views it returns must not be held across invoke() or allocate_tensors().
+    input_tensor = interpreter.tensor(input_index)
+    # Batching needs a dynamic batch dimension in the model
+    max_batch_size = MAX_BATCH_SIZE if input_details[0]['shape_signature'][0] == -1 else 1
+    batch_size = 1
+    
+    while True:
+        batch = next_batch(inference_queue, max_batch_size)
+        try:
+            if len(batch) != batch_size:
+                interpreter.resize_tensor_input(input_index, [len(batch), 224, 224, 3])
+                interpreter.allocate_tensors()
+                batch_size = len(batch)
+            
+            # Each request fills its own (224, 224, 3) slot of the input tensor
+            for i, (fill, _) in enumerate(batch):
+                fill(input_tensor()[i])
+            
+            interpreter.invoke()
+            
+            predictions = interpreter.get_tensor(output_details[0]['index'])
+            if output_details[0]['dtype'] != np.float32:
+                predictions = dequantize_output(predictions, output_details[0])
+            
+            for i, (_, future) in enumerate(batch):
+                future.set_result(predictions[i:i + 1])
+        except Exception as e:
+            fail_batch(batch, e)
+
+def run_inference(fill):
+    """Queue a request for the inference worker and wait for its predictions.
+    fill(dst) must write the normalized/quantized 224x224 RGB image into dst."""
+    future = Future()
+    inference_queue.put((fill, future))
+    return future.result()
+
+def _infer(fill):
+    """Run one image through the model and return (index, confidence, probabilities list)"""
+    p = run_inference(fill)[0]
+    predicted_class_index = int(p.argmax())
+    # One C-level conversion of the whole vector; confidence is read from it
+    probabilities = p.tolist()
+    return predicted_class_index, probabilities[predicted_class_index], probabilities
+
+# A single worker thread owns the interpreter (TFLite interpreters are not
+# thread-safe); the stream and HTTP paths both submit work to it
+inference_queue = queue.Queue()
+
+if interpreter is not None:
+    if input_details[0]['dtype'] == np.float32:
+        # Compile the kernel now so the first streamed frame doesn't pay for it
+        preprocess_frame(np.zeros((480, 640, 3), dtype=np.uint8), np.empty((224, 224, 3), dtype=np.float32))
+        print(f"Stream preprocessing: {'Numba fused kernel' if njit is not None else 'OpenCV'}")
+    
+    threading.Thread(target=inference_worker, daemon=True).start()
+
 def process_frame(frame):
     """Process a single frame through the TensorFlow Lite model and return predictions"""
     if interpreter is None:
@@ -93,42 +224,28 @@ def process_frame(frame):
         }
     
     try:
-        # Resize frame to model input size (224x224)
-        resized = cv2.resize(frame, (224, 224))
-        
-        # Convert BGR to RGB (OpenCV uses BGR, model expects RGB)
-        rgb_frame = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-        
-        # Convert to numpy array and normalize
-        image_array = np.asarray(rgb_frame, dtype=np.float32) / 255.0
-        
-        # Add batch dimension
-        image_array = np.expand_dims(image_array, axis=0)
-        
-        # Set input tensor
-        interpreter.set_tensor(input_details[0]['index'], image_array)
+        if input_details[0]['dtype'] == np.float32:
+            def fill(dst):
+                # Resize, BGR->RGB and normalize straight into the input tensor
+                preprocess_frame(frame, dst)
+        else:
+            # Resize frame to model input size (224x224) on this thread.
+            # Nearest-neighbour keeps the stream path cheap; HTTP uses INTER_AREA
+            resized = cv2.resize(frame, (224, 224), dst=get_resize_buffer(), interpolation=cv2.INTER_NEAREST)
+            
+            def fill(dst):
+                # Quantize the BGR->RGB view (INT8 model; uint8 pixels go in as-is
+                # when the input scale is 1/255)
+                dst[...] = quantize_input(resized[..., ::-1], input_details[0])
         
         # Run inference
-        interpreter.invoke()
-        
-        # Get output tensor
-        predictions = interpreter.get_tensor(output_details[0]['index'])
-        
-        # Get the highest confidence prediction
-        confidence = float(np.max(predictions[0]))
-        predicted_class_index = int(np.argmax(predictions[0]))
+        predicted_class_index, confidence, probabilities = _infer(fill)
         
         # Get material type
-        if predicted_class_index < len(labels):
-            material_type = labels[predicted_class_index]
-        else:
-            material_type = "Unknown"
+        material_type = LABELS[predicted_class_index]
         
         # Get all predictions
-        all_predictions = {
-            labels[i]: float(predictions[0][i]) 
-            for i in range(len(labels))
-        }
+        all_predictions = dict(zip(LABELS, probabilities))
         
         return {
             "materialType": material_type,
@@ -142,6 +259,14 @@ def process_frame(frame):
         traceback.print_exc()
         return None
 
+@functools.lru_cache(maxsize=256)
+def _text_size(text, font_scale, thickness):
+    """cv2.getTextSize for the overlay font, cached (text repeats across frames)"""
+    return cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+
+# Background width for the per-label lines, measured once with the widest possible line
+PREDICTION_BOX_WIDTH = max((_text_size(f"{label}: 100.00%", 0.6, 1)[0][0] for label in labels), default=0)
+
 def draw_predictions(frame, prediction):
     """Draw prediction information on the frame"""
     if prediction is None:
@@ -158,7 +283,7 @@ def draw_predictions(frame, prediction):
     thickness = 2
     
     # Get text size for positioning
-    (text_width, text_height), baseline = cv2.getTextSize(text, font, font_scale, thickness)
+    (text_width, text_height), baseline = _text_size(text, font_scale, thickness)
     
     # Background rectangle for main prediction
     cv2.rectangle(frame, (10, 10), (text_width + 20, text_height + 30), (0, 0, 0), -1)
@@ -180,23 +305,39 @@ def draw_predictions(frame, prediction):
     y_offset = text_height + 50
     for i, (label, conf) in enumerate(all_predictions.items()):
         pred_text = f"{label}: {conf:.2%}"
-        # Background for each prediction
-        (pred_width, pred_height), _ = cv2.getTextSize(pred_text, font, 0.6, 1)
-        cv2.rectangle(frame, (10, y_offset - 15), (pred_width + 15, y_offset + 5), (0, 0, 0), -1)
+        # Background for each prediction (fixed width, measured at startup)
+        cv2.rectangle(frame, (10, y_offset - 15), (PREDICTION_BOX_WIDTH + 15, y_offset + 5), (0, 0, 0), -1)
         cv2.putText(frame, pred_text, (12, y_offset), font, 0.6, (255, 255, 255), 1)
         y_offset += 25
     
     # Draw frame counter
-    with prediction_lock:
-        frame_count = latest_prediction.get("frame_count", 0)
+    frame_count = prediction.get("frame_count", 0)
     cv2.putText(frame, f"Frames: {frame_count}", (10, frame.shape[0] - 10), 
                 font, 0.5, (255, 255, 255), 1)
     
     return frame
 
+def iter_mjpeg_frames(response, chunk_size=4096):
+    """Yield raw JPEG images from a multipart/x-mixed-replace stream response"""
+    buffer = bytearray()
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        buffer += chunk
+        while True:
+            start = buffer.find(b'\xff\xd8')  # JPEG SOI marker
+            if start < 0:
+                # Keep the last byte in case a marker is split across chunks
+                del buffer[:-1]
+                break
+            end = buffer.find(b'\xff\xd9', start + 2)  # JPEG EOI marker
+            if end < 0:
+                del buffer[:start]
+                break
+            yield bytes(buffer[start:end + 2])
+            del buffer[:end + 2]
+
 def monitor_stream():
     """Monitor ESP32-CAM stream and process frames in real-time with OpenCV display"""
-    global latest_prediction, monitoring_active
+    global latest_frame_jpeg, monitoring_active
     
     monitoring_active = True
     print(f"Starting stream monitoring from {ESP32_CAM_STREAM_URL}")
@@ -208,12 +349,14 @@ def monitor_stream():
     cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
     cv2.resizeWindow(window_name, 1280, 720)  # Resize window
     
-    cap = None
+    response = None
+    frames = None
+    last_frame = None  # Last displayed frame, shown while the stream is stalled
     frame_skip = 5  # Process every 5th frame to reduce load
     frame_counter = 0
-    last_frame_time = time.time()  # Track when last frame was received
     
-    # Setup requests session for better stream handling (for future use)
+    # Read the MJPEG stream directly: the camera already sends JPEGs, so there
+    # is no need for FFmpeg to demux it through cv2.VideoCapture
     session = requests.Session()
     retry_strategy = Retry(total=3, backoff_factor=0.1)
     adapter = HTTPAdapter(max_retries=retry_strategy)
@@ -222,21 +365,16 @@ def monitor_stream():
     
     while monitoring_active:
         try:
-            if cap is None or not cap.isOpened():
+            if frames is None:
                 print(f"Connecting to ESP32-CAM stream at {ESP32_CAM_STREAM_URL}...")
-                cap = cv2.VideoCapture(ESP32_CAM_STREAM_URL)
-                
-                # Set buffer size to reduce latency
                 try:
-                    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                    # These properties might not be supported on all backends
-                    cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, 5000)  # 5 second timeout
-                    cap.set(cv2.CAP_PROP_READ_TIMEOUT_MSEC, 5000)  # 5 second timeout
-                except:
-                    pass  # Some backends don't support these properties
-                
-                if not cap.isOpened():
-                    print(f"Failed to connect to stream. Retrying in 3 seconds...")
+                    # The 5 second timeout also applies to each read, so a
+                    # stalled stream raises instead of blocking forever
+                    response = session.get(ESP32_CAM_STREAM_URL, stream=True, timeout=5)
+                    response.raise_for_status()
+                    frames = iter_mjpeg_frames(response)
+                except requests.exceptions.RequestException as e:
+                    print(f"Failed to connect to stream ({e}). Retrying in 3 seconds...")
                     # Show waiting message in window
                     waiting_frame = np.zeros((480, 640, 3), dtype=np.uint8)
                     cv2.putText(waiting_frame, "Connecting to ESP32-CAM...", 
@@ -254,60 +392,31 @@ def monitor_stream():
                     time.sleep(3)
                     continue
             
-            # Try to read frame with timeout handling
-            ret = False
-            frame = None
-            
-            # Check if we've been waiting too long (timeout detection)
-            time_since_last_frame = time.time() - last_frame_time
-            if time_since_last_frame > 10:  # 10 seconds without frames = timeout
+            # Blocks until the next complete JPEG arrives (or the read times out)
+            try:
+                jpeg = next(frames, None)
+            except requests.exceptions.RequestException:
                 print("Stream timeout detected. Reconnecting...")
-                cap.release()
-                cap = None
+                # Show last successful frame while reconnecting
+                if last_frame is not None:
+                    cv2.putText(last_frame, "Stream paused...", 
+                               (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+                    cv2.imshow(window_name, last_frame)
+                    cv2.waitKey(1)
+                response.close()
+                frames = None
                 continue
             
-            # Try reading frame (non-blocking if possible)
-            ret, frame = cap.read()
-            
-            # If read succeeds, update timestamp
-            if ret and frame is not None:
-                last_frame_time = time.time()
+            if jpeg is None:
+                print("Stream closed. Reconnecting...")
+                response.close()
+                frames = None
+                continue
             
-            # If read fails, check if stream is still open
-            if not ret or frame is None:
-                # Check if stream is actually open
-                if not cap.isOpened():
-                    print("Stream closed. Reconnecting...")
-                    cap.release()
-                    cap = None
-                    continue
-                else:
-                    # Frame read failed but stream is open - might be temporary
-                    # Show last frame or error message but don't wait too long
-                    if "frame" in latest_prediction:
-                        # Show last successful frame
-                        frame_with_overlay = latest_prediction.get("frame")
-                        if frame_with_overlay is not None:
-                            cv2.putText(frame_with_overlay, "Stream paused...", 
-                                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-                            cv2.imshow(window_name, frame_with_overlay)
-                    else:
-                        # Show error message
-                        error_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                        cv2.putText(error_frame, "Reading frame...", 
-                                   (200, 230), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
-                        cv2.putText(error_frame, "Press 'q' to quit", 
-                                   (200, 280), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 1)
-                        cv2.imshow(window_name, error_frame)
-                    
-                    key = cv2.waitKey(1) & 0xFF
-                    if key == ord('q'):
-                        monitoring_active = False
-                        break
-                    
-                    # Don't wait long - try reading again quickly
-                    time.sleep(0.1)
-                    continue
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                # Corrupt JPEG (e.g. truncated by a Wi-Fi drop); wait for the next one
+                continue
             
             frame_counter += 1
             
@@ -316,24 +425,42 @@ def monitor_stream():
                 prediction = process_frame(frame)
                 
                 if prediction and prediction.get("materialType") != "Model Not Loaded":
+                    # Update in place; /prediction copies the dict under the same lock
                     with prediction_lock:
-                        latest_prediction = {
+                        latest_prediction.update({
                             "materialType": prediction["materialType"],
                             "confidence": prediction["confidence"],
                             "allPredictions": prediction["allPredictions"],
                             "frame_count": frame_counter
-                        }
+                        })
             
-            # Draw predictions on frame
+            # Draw predictions on frame. This thread is the only writer of
+            # latest_prediction, so a reference is enough (no dict copy)
             with prediction_lock:
-                current_pred = latest_prediction.copy()
+                current_pred = latest_prediction
             
-            # Always draw overlay (will show "Model Not Loaded" if model isn't available)
-            frame_with_overlay = draw_predictions(frame.copy(), current_pred if current_pred.get("materialType") != "None" else None)
+            if current_pred.get("materialType") != "None":
+                # Draw in place: imdecode returns a fresh buffer every iteration,
+                # so the frame itself can be stored (no frame copy). A few
+                # rectangles and cached-size putText calls are cheaper than
+                # caching and compositing the overlay
+                frame_with_overlay = draw_predictions(frame, current_pred)
+                
+                # Encode once here; every web client shares the same JPEG bytes
+                ret, buffer = cv2.imencode('.jpg', frame_with_overlay, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                frame_jpeg = buffer.tobytes() if ret else None
+            else:
+                # Nothing to draw yet, so forward the camera's JPEG untouched
+                frame_with_overlay = frame
+                frame_jpeg = jpeg
             
-            # Store latest frame for web streaming
-            with prediction_lock:
-                latest_prediction["frame"] = frame_with_overlay
+            # Keep the frame for the stall display, publish the encoded JPEG for
+            # web streaming, then wake the web clients waiting in generate_frames
+            last_frame = frame_with_overlay
+            if frame_jpeg is not None:
+                with frame_event:
+                    latest_frame_jpeg = frame_jpeg
+                    frame_event.notify_all()
             
             # Display frame in OpenCV window (non-blocking)
             cv2.imshow(window_name, frame_with_overlay)
@@ -345,9 +472,6 @@ def monitor_stream():
                 monitoring_active = False
                 break
             
-            # Small delay to prevent excessive CPU usage
-            time.sleep(0.01)  # ~100 FPS max
-            
         except KeyboardInterrupt:
             print("\nInterrupted by user")
             monitoring_active = False
@@ -367,48 +491,52 @@ def monitor_stream():
             cv2.waitKey(100)
             
             time.sleep(2)
-            if cap is not None:
-                cap.release()
-                cap = None
+            if response is not None:
+                response.close()
+                frames = None
     
     # Cleanup
-    if cap is not None:
-        cap.release()
+    if response is not None:
+        response.close()
     cv2.destroyAllWindows()
     print("Stream monitoring stopped")
 
 def generate_frames():
     """Generate frames for web streaming with overlay"""
+    # Placeholder shown until the stream produces frames (encoded once per client)
+    placeholder = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(placeholder, "Waiting for ESP32-CAM stream...", 
+               (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    cv2.putText(placeholder, f"Stream URL: {ESP32_CAM_STREAM_URL}", 
+               (50, 280), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 1)
+    placeholder_bytes = cv2.imencode('.jpg', placeholder, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+    
+    frame_bytes = None
+    
     while True:
         try:
-            with prediction_lock:
-                if "frame" in latest_prediction:
-                    frame = latest_prediction["frame"].copy()
-                else:
-                    # Create a placeholder frame if no stream available
-                    frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                    cv2.putText(frame, "Waiting for ESP32-CAM stream...", 
-                               (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                    cv2.putText(frame, f"Stream URL: {ESP32_CAM_STREAM_URL}", 
-                               (50, 280), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 1)
+            # Block until monitor_stream publishes a different JPEG; on timeout the
+            # current frame is re-sent so the connection stays alive
+            with frame_event:
+                frame_event.wait_for(lambda: (latest_frame_jpeg or placeholder_bytes) is not frame_bytes, timeout=1.0)
+                # JPEG bytes are encoded once by monitor_stream; no per-client re-encode
+                frame_bytes = latest_frame_jpeg or placeholder_bytes
             
-            # Encode frame as JPEG
-            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            if ret:
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            
-            time.sleep(0.033)  # ~30 FPS
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
             
         except Exception as e:
             print(f"Error generating frame: {e}")
             time.sleep(1)
 
+def ojsonify(obj, status=200):
+    """JSON response serialized with orjson (faster than Flask's jsonify; NumPy values pass straight through)"""
+    return app.response_class(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY), status=status, mimetype="application/json")
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({
+    return ojsonify({
         "status": "healthy",
         "model_loaded": interpreter is not None,
         "labels": labels,
@@ -427,9 +555,7 @@ def get_prediction():
     """Get latest prediction results"""
     with prediction_lock:
         pred = latest_prediction.copy()
-        if "frame" in pred:
-            del pred["frame"]  # Remove frame data from JSON response
-    return jsonify(pred)
+    return ojsonify(pred)
 
 @app.route('/bin/update', methods=['POST'])
 def bin_update():
@@ -440,21 +566,21 @@ def bin_update():
             print(f"Bin update received: {data}")
             # You can store this data, log it, or process it as needed
             # For now, just acknowledge receipt
-            return jsonify({
+            return ojsonify({
                 "success": True,
                 "message": "Bin update received"
             })
         else:
-            return jsonify({
+            return ojsonify({
                 "success": False,
                 "error": "No data received"
-            }), 400
+            }, 400)
     except Exception as e:
         print(f"Error processing bin update: {e}")
-        return jsonify({
+        return ojsonify({
             "success": False,
             "error": str(e)
-        }), 500
+        }, 500)
 
 @app.route('/identify/material', methods=['POST'])
 def identify_material():
@@ -463,10 +589,10 @@ def identify_material():
     Accepts JPEG image binary data or base64 encoded image
     """
     if interpreter is None:
-        return jsonify({
+        return ojsonify({
             "success": False,
             "error": "Model not loaded"
-        }), 500
+        }, 500)
     
     try:
         # Get image data
@@ -481,60 +607,44 @@ def identify_material():
             if 'image' in json_data:
                 image_data = base64.b64decode(json_data['image'])
             else:
-                return jsonify({
+                return ojsonify({
                     "success": False,
                     "error": "No image data in JSON"
-                }), 400
+                }, 400)
         else:
             # Try to read as binary
             image_data = request.data
         
         if not image_data:
-            return jsonify({
+            return ojsonify({
                 "success": False,
                 "error": "No image data received"
-            }), 400
-        
-        # Process image
-        image = Image.open(io.BytesIO(image_data))
+            }, 400)
         
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        # Decode image (libjpeg-turbo SIMD decode, always 3-channel BGR)
+        image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image data")
         
-        # Save raw image before processing
-        if SAVE_IMAGES:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-            temp_filename = f"{IMAGES_SAVE_DIR}/temp_{timestamp}.jpg"
-            image.save(temp_filename, 'JPEG', quality=95)
+        # Resize to model input size (Teachable Machine default is 224x224) on the
+        # request thread, so only normalization runs on the shared inference worker
+        resized = cv2.resize(image, (224, 224), dst=get_resize_buffer(), interpolation=cv2.INTER_AREA)
         
-        # Resize to model input size (Teachable Machine default is 224x224)
-        image = image.resize((224, 224))
+        # Convert BGR to RGB via a reversed-channel view (OpenCV uses BGR, model expects RGB)
+        rgb_image = resized[..., ::-1]
         
-        # Convert to numpy array and normalize
-        image_array = np.asarray(image, dtype=np.float32) / 255.0
-        
-        # Add batch dimension
-        image_array = np.expand_dims(image_array, axis=0)
-        
-        # Set input tensor
-        interpreter.set_tensor(input_details[0]['index'], image_array)
-        
-        # Run inference
-        interpreter.invoke()
-        
-        # Get output tensor
-        predictions = interpreter.get_tensor(output_details[0]['index'])
+        def fill(dst):
+            # Normalize (float model) or quantize (INT8 model) straight into the input tensor
+            if input_details[0]['dtype'] == np.float32:
+                np.divide(rgb_image, np.float32(255.0), out=dst)
+            else:
+                dst[...] = quantize_input(rgb_image, input_details[0])
         
-        # Get the highest confidence prediction
-        confidence = float(np.max(predictions[0]))
-        predicted_class_index = int(np.argmax(predictions[0]))
+        # Run inference (batched with other concurrent requests)
+        predicted_class_index, confidence, probabilities = _infer(fill)
         
         # Get material type
-        if predicted_class_index < len(labels):
-            material_type = labels[predicted_class_index]
-        else:
-            material_type = "Unknown"
+        material_type = LABELS[predicted_class_index]
         
         # Determine action based on material type
         action = None
@@ -542,45 +652,42 @@ def identify_material():
             action = "sort_plastic"
         elif material_type == "Tin Can":
             action = "sort_tin_can"
-        else:  # Other or Unknown
+        else:  # Other
             action = "reject"
         
-        # Rename saved image with material type and confidence
+        # Queue the received JPEG for saving, named with material type and confidence
         if SAVE_IMAGES:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
             confidence_percent = int(confidence * 100)
             final_filename = f"{IMAGES_SAVE_DIR}/{timestamp}_{material_type.replace(' ', '_')}_{confidence_percent}pct.jpg"
             try:
-                os.rename(temp_filename, final_filename)
-                print(f"Saved image: {final_filename}")
-            except Exception as e:
-                print(f"Error renaming image: {e}")
+                save_queue.put_nowait((image_data, final_filename))
+            except queue.Full:
+                print(f"Save queue full, dropping image: {final_filename}")
         
         print(f"Prediction: {material_type} (confidence: {confidence:.2f}, index: {predicted_class_index})")
         
-        return jsonify({
+        return ojsonify({
             "success": True,
             "materialType": material_type,
             "confidence": round(confidence, 2),
             "action": action,
-            "allPredictions": {
-                labels[i]: float(predictions[0][i]) 
-                for i in range(len(labels))
-            }
+            "allPredictions": dict(zip(LABELS, probabilities))
         })
         
     except Exception as e:
         print(f"Error processing image: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return ojsonify({
             "success": False,
             "error": str(e)
-        }), 500
+        }, 500)
 
 @app.route('/identify/test', methods=['GET'])
 def test():
     """Test endpoint"""
-    return jsonify({
+    return ojsonify({
         "message": "Backend server is running",
         "model_loaded": interpreter is not None,
         "labels_available": labels,
@@ -661,10 +768,9 @@ if __name__ == '__main__':
     print("  - GET  /identify/test - Test endpoint")
     print("  - POST /identify/material - Identify material from image")
     
-    # For production VPS deployment, consider using gunicorn instead:
-    # gunicorn -w 2 -b 0.0.0.0:5001 --timeout 120 backend_server:app
+    # For production VPS deployment, use gunicorn instead:
+    # gunicorn -c gunicorn_server_conf.py backend_server:app
     
     # Run Flask app on port 5001 (port 5000 is often reserved on Windows)
     # use_reloader=False prevents timer overflow warnings
-    # For VPS: Set threaded=True for better concurrency on single CPU
-    app.run(host='0.0.0.0', port=5001, debug=False, use_reloader=False, threaded=True)
+    app.run(host='0.0.0.0', port=5001, debug=False, use_reloader=False)
@@ -0,0 +1,128 @@
+"""
+Convert a Teachable Machine Keras model to a quantized TensorFlow Lite model
+Usage: python convert_model.py <keras_model.h5> <calibration_images_dir> [output.tflite]
+       python convert_model.py <keras_model.h5> --fp16 [output.tflite]
+
+INT8: the calibration images should be a few hundred representative photos of
+the materials (JPEG/PNG). They are preprocessed like backend_api.py's
+decode_image: draft-mode JPEG decode, then an OpenCV INTER_AREA resize.
+INT8 models run on XNNPACK's int8 kernels (VNNI on supporting x86 CPUs).
+backend_server.py picks up the default output (model/model_int8.tflite)
+automatically; backend_api.py only uses it once MODEL_PATH points at it.
+
+FP16: weights are stored as float16 (half the size) while inputs and outputs
+stay float32, so no calibration data is needed and accuracy is unchanged in
+practice. Use this if INT8 loses too much accuracy.
+"""
+
+import os
+import sys
+import numpy as np
+import cv2
+import tensorflow as tf
+from PIL import Image
+
+MAX_CALIBRATION_IMAGES = 200
+
+
+def representative_dataset(images_dir):
+    """Yield preprocessed calibration images for post-training quantization"""
+    filenames = sorted(
+        name for name in os.listdir(images_dir)
+        if name.lower().endswith(('.jpg', '.jpeg', '.png'))
+    )[:MAX_CALIBRATION_IMAGES]
+
+    if not filenames:
+        raise ValueError(f"No calibration images found in {images_dir}")
+
+    print(f"Calibrating with {len(filenames)} images from {images_dir}")
+
+    for name in filenames:
+        image = Image.open(os.path.join(images_dir, name))
+        # Let libjpeg downscale during decode, as the API does
+        image.draft('RGB', (224, 224))
+        pixels = np.asarray(image.convert('RGB'))
+        resized = cv2.resize(pixels, (224, 224), interpolation=cv2.INTER_AREA)
+        image_array = resized.astype(np.float32) / 255.0
+        yield [np.expand_dims(image_array, axis=0)]
+
+
+def convert_model(keras_model_path, images_dir, output_path="model/model_int8.tflite"):
+    """Convert a Keras model to a full-integer INT8 TensorFlow Lite model"""
+    try:
+        model = tf.keras.models.load_model(keras_model_path, compile=False)
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: representative_dataset(images_dir)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+        tflite_model = converter.convert()
+
+        with open(output_path, 'wb') as f:
+            f.write(tflite_model)
+
+        print(f"\n✓ Saved INT8 model to: {output_path} ({len(tflite_model)} bytes)")
+        if os.path.abspath(output_path) == os.path.abspath("model/model_int8.tflite"):
+            print("backend_server.py loads this file automatically (INT8_MODEL_PATH); delete it to go back to the float model")
+        print("backend_api.py: set MODEL_PATH to use it")
+        return output_path
+
+    except FileNotFoundError as e:
+        print(f"❌ Error: File not found: {e}")
+        return None
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+def convert_model_fp16(keras_model_path, output_path="model/model_fp16.tflite"):
+    """Convert a Keras model to a TensorFlow Lite model with float16 weights"""
+    try:
+        model = tf.keras.models.load_model(keras_model_path, compile=False)
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+
+        tflite_model = converter.convert()
+
+        with open(output_path, 'wb') as f:
+            f.write(tflite_model)
+
+        print(f"\n✓ Saved FP16 model to: {output_path} ({len(tflite_model)} bytes)")
+        print("Set MODEL_PATH in backend_api.py or backend_server.py to use it")
+        return output_path
+
+    except FileNotFoundError as e:
+        print(f"❌ Error: File not found: {e}")
+        return None
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python convert_model.py <keras_model.h5> <calibration_images_dir> [output.tflite]")
+        print("       python convert_model.py <keras_model.h5> --fp16 [output.tflite]")
+        print("\nExample:")
+        print("  python convert_model.py keras_model.h5 calibration_images/")
+        print("  python convert_model.py keras_model.h5 --fp16")
+        sys.exit(1)
+
+    if sys.argv[2] == "--fp16":
+        if len(sys.argv) > 3:
+            convert_model_fp16(sys.argv[1], sys.argv[3])
+        else:
+            convert_model_fp16(sys.argv[1])
+    elif len(sys.argv) > 3:
+        convert_model(sys.argv[1], sys.argv[2], sys.argv[3])
+    else:
+        convert_model(sys.argv[1], sys.argv[2])
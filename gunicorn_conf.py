@@ -0,0 +1,37 @@
+"""
+Gunicorn configuration for the Material Identification API
+Usage: gunicorn -c gunicorn_conf.py wsgi:app
+
+gthread workers keep HTTP connections alive and hand concurrent requests to
+backend_api's batching inference workers.
+
+The app (TensorFlow, OpenCV, labels) is imported once in the master with
+preload_app and shared copy-on-write with the workers, which cuts RSS and
+speeds up worker start. TFLite interpreters and their worker threads do not
+survive fork(), so each worker loads its own in post_fork.
+"""
+
+import multiprocessing
+import os
+
+bind = "0.0.0.0:5001"
+workers = multiprocessing.cpu_count()
+worker_class = "gthread"
+threads = 4  # Concurrent requests per worker, batched onto its interpreter
+keepalive = 5
+timeout = 30
+preload_app = True
+
+# Skip model loading while the master imports the app
+os.environ["DEFER_MODEL_LOAD"] = "1"
+
+# Split the cores between workers so TFLite threads don't oversubscribe the
+# CPU: one interpreter per worker, each with an equal share of the cores
+os.environ.setdefault("NUM_THREADS", str(max(1, multiprocessing.cpu_count() // workers)))
+os.environ.setdefault("INTERPRETER_POOL_SIZE", "1")
+
+
+def post_fork(server, worker):
+    """Load the TFLite interpreters inside each worker process"""
+    import backend_api
+    backend_api.load_model()
@@ -0,0 +1,22 @@
+"""
+Gunicorn configuration for the Material Identification Backend Server
+Usage: gunicorn -c gunicorn_server_conf.py backend_server:app
+
+A single process owns the TFLite interpreter and its inference worker thread;
+gthread threads only parse requests and hand them to that worker, so they
+don't multiply against XNNPACK's thread pool.
+"""
+
+import os
+
+bind = "0.0.0.0:5001"
+workers = 1  # One interpreter; more processes would oversubscribe the CPU
+worker_class = "gthread"
+threads = 4
+keepalive = 5
+timeout = 120
+
+# Keep OpenCV/NumPy from spinning up their own pools next to XNNPACK's.
+# Set here so the worker inherits them before it imports cv2 and numpy
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
@@ -0,0 +1,57 @@
+"""
+Inference helpers shared by backend_api.py and backend_server.py
+Quantization, micro-batching and per-thread resize buffers for TFLite workers
+"""
+
+import queue
+import threading
+import numpy as np
+
+
+def quantize_input(pixels, details):
+    """Map 0-255 pixels onto a quantized (int8/uint8) input tensor, folding in the /255 normalization"""
+    scale, zero_point = details['quantization']
+    info = np.iinfo(details['dtype'])
+    quantized = np.round(pixels * np.float32(1.0 / (255.0 * scale)) + zero_point)
+    return np.clip(quantized, info.min, info.max).astype(details['dtype'])
+
+
+def dequantize_output(output, details):
+    """Convert a quantized output tensor back to FP32 probabilities"""
+    scale, zero_point = details['quantization']
+    return (output.astype(np.float32) - zero_point) * scale
+
+
+def next_batch(requests, max_batch_size):
+    """Block for one queued request, then add any others that are already waiting"""
+    # No batching window: a lone request runs immediately, and requests that
+    # arrive while a batch is running queue up to form the next one
+    batch = [requests.get()]
+    while len(batch) < max_batch_size:
+        try:
+            batch.append(requests.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def fail_batch(batch, error):
+    """Fail every (input, future) request in a batch with error"""
+    # Drop the traceback: its frames can hold views of the input tensor,
+    # which would make every later invoke() fail until a GC cycle runs
+    error = error.with_traceback(None)
+    for _, future in batch:
+        future.set_exception(error)
+
+
+# A caller blocks until its image has been consumed by inference,
+# so one resize buffer per thread can be reused safely
+resize_buffers = threading.local()
+
+
+def get_resize_buffer():
+    """Per-thread 224x224 uint8 buffer reused as the resize destination across requests"""
+    buffer = getattr(resize_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = resize_buffers.buffer = np.empty((224, 224, 3), dtype=np.uint8)
+    return buffer
@@ -22,7 +22,7 @@ source venv/bin/activate
 # Install Python packages
 echo "Installing Python packages..."
 pip install --upgrade pip
-pip install flask flask-cors tensorflow pillow numpy gunicorn
+pip install flask flask-cors tensorflow pillow opencv-python-headless numpy pybase64 orjson gunicorn
 
 # Test the application
 echo "Testing application..."
@@ -42,9 +42,9 @@ echo "  python backend_api.py"
 echo ""
 echo "To run in production with Gunicorn:"
 echo "  source venv/bin/activate"
-echo "  gunicorn -w 2 -b 0.0.0.0:5001 --timeout 120 backend_api:app"
+echo "  gunicorn -c gunicorn_conf.py wsgi:app"
 echo ""
 echo "To run in background:"
-echo "  nohup gunicorn -w 2 -b 0.0.0.0:5001 --timeout 120 backend_api:app > api.log 2>&1 &"
+echo "  nohup gunicorn -c gunicorn_conf.py wsgi:app > api.log 2>&1 &"
 echo ""
 echo "=========================================="
@@ -0,0 +1,6 @@
+"""
+WSGI entry point for the Material Identification API
+Usage: gunicorn -c gunicorn_conf.py wsgi:app
+"""
+
+from backend_api import app